@@ -6,27 +6,176 @@ import pandas as pd
 import numpy as np
 from scipy import stats
 import logging
+from collections import namedtuple
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Expense rows shared by every consumer of a request's transactions:
+# rows are positions in the DataFrame, codes index into categories
+# (the sorted category labels present; -1 for a missing label)
+ExpenseArrays = namedtuple('ExpenseArrays', ['rows', 'abs_amount', 'codes', 'categories'])
 
-def detect_anomalies(df: pd.DataFrame, z_threshold: float = 3.0) -> dict:
+
+def _grouped_zscores(values: np.ndarray, codes: np.ndarray, n_groups: int) -> tuple:
+    """
+    Per-category mean/std and per-row Z-scores using bincount, with no Python loop
+
+    Args:
+        values: Float array of amounts
+        codes: Integer category codes (-1 for missing)
+        n_groups: Number of possible categories
+
+    Returns:
+        Tuple of (z_scores, means, stds, counts)
+    """
+    known = codes >= 0
+    known_codes = codes[known]
+    known_values = values[known]
+    
+    counts = np.bincount(known_codes, minlength=n_groups)
+    sums = np.bincount(known_codes, weights=known_values, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+        
+        # Sample variance from squared deviations around the group mean
+        sq_dev = np.bincount(known_codes, weights=(known_values - means[known_codes]) ** 2, minlength=n_groups)
+        stds = np.where(counts > 1, np.sqrt(sq_dev / (counts - 1)), np.nan)
+    
+    # Only calculate Z-scores if we have enough data and std > 0;
+    # otherwise mark as non-anomalous
+    valid_group = (counts >= 3) & (stds > 0)
+    rows = np.flatnonzero(known)[valid_group[known_codes]]
+    z_scores = np.zeros(values.shape[0])
+    z_scores[rows] = (values[rows] - means[codes[rows]]) / stds[codes[rows]]
+    
+    return z_scores, means, stds, counts
+
+
+def _category_runs(codes: np.ndarray, n_groups: int) -> tuple:
+    """
+    Sort category codes once so each category forms a contiguous run
+
+    Args:
+        codes: Integer category codes (-1 for missing)
+        n_groups: Number of possible categories
+
+    Returns:
+        Tuple of (order, group_starts) where rows of group g are
+        order[group_starts[g]:group_starts[g + 1]]
+    """
+    order = np.argsort(codes, kind='stable')
+    group_starts = np.searchsorted(codes[order], np.arange(n_groups + 1))
+    return order, group_starts
+
+
+def expense_arrays(df: pd.DataFrame) -> ExpenseArrays:
+    """
+    Extract expense rows as NumPy arrays without copying the DataFrame
+    
+    Args:
+        df: DataFrame with categorized transactions
+        
+    Returns:
+        ExpenseArrays for the expenses (negative net_amount) in df
+    """
+    net_amount = df['net_amount'].to_numpy()
+    mask = net_amount < 0
+    rows = np.flatnonzero(mask)
+    abs_amount = np.abs(net_amount[mask]).astype(np.float64)
+    codes, categories = pd.factorize(df['category'].to_numpy()[mask], sort=True)
+    return ExpenseArrays(rows, abs_amount, codes, list(categories))
+
+
+def category_spending(expenses: ExpenseArrays) -> pd.Series:
+    """
+    Total spending per category, summed over sorted contiguous runs
+    
+    Args:
+        expenses: Expense arrays from expense_arrays()
+        
+    Returns:
+        Series of totals indexed by category, for categories with spending
+    """
+    order, group_starts = _category_runs(expenses.codes, len(expenses.categories))
+    observed = np.diff(group_starts) > 0
+    sorted_amounts = expenses.abs_amount[order]
+    sums = np.add.reduceat(sorted_amounts, group_starts[:-1][observed]) if observed.any() else []
+    return pd.Series(sums, index=[expenses.categories[i] for i in np.flatnonzero(observed)], dtype=float)
+
+
+def _top_k_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k largest values, largest first, in O(N) selection
+
+    Matches Series.nlargest(k, keep='first'): values tied with the k-th
+    largest are taken in order of position.
+
+    Args:
+        values: Array to select from
+        k: Number of positions to return
+
+    Returns:
+        Index array ordered by descending value (ties keep original order)
+    """
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    kth = np.partition(values, len(values) - k)[len(values) - k]
+    candidates = np.flatnonzero(values >= kth)
+    return candidates[np.lexsort((candidates, -values[candidates]))][:k]
+
+
+def _to_records(df: pd.DataFrame, rows: np.ndarray, amounts: np.ndarray, codes: np.ndarray,
+                categories: list, z_scores: np.ndarray, expected_range: np.ndarray = None) -> list:
+    """
+    Convert selected expense rows to output dictionaries without iterating rows
+
+    Args:
+        df: DataFrame with date and desc columns
+        rows: Positions of the selected rows in df
+        amounts: Absolute amounts for the selected rows
+        codes: Category codes for the selected rows
+        categories: Category labels indexed by code
+        z_scores: Z-scores for the selected rows
+        expected_range: Expected range strings for the selected rows (optional)
+
+    Returns:
+        List of transaction dictionaries
+    """
+    dates = df['date'].iloc[rows].dt.strftime('%Y-%m-%d')
+    dates = dates.astype(object).where(dates.notna(), None).tolist()
+    descs = df['desc'].to_numpy()[rows].tolist()
+    labels = [categories[code] if code >= 0 else None for code in codes.tolist()]
+    columns = zip(dates, descs, amounts.tolist(), labels, z_scores.tolist())
+    
+    records = [
+        {'date': d, 'description': desc, 'amount': a, 'category': c, 'z_score': z}
+        for d, desc, a, c, z in columns
+    ]
+    if expected_range is not None:
+        for record, er in zip(records, expected_range.tolist()):
+            record['expected_range'] = er
+    return records
+
+
+def detect_anomalies(df: pd.DataFrame, z_threshold: float = 3.0, expenses: ExpenseArrays = None) -> dict:
     """
     Detect anomalous transactions based on Z-score analysis
     
     Args:
         df: DataFrame with categorized transactions
         z_threshold: Z-score threshold for anomaly detection (default: 3.0)
+        expenses: Precomputed expense arrays for df (optional)
         
     Returns:
         Dictionary containing anomaly information
     """
     try:
         # Filter for expenses only (negative net_amount)
-        expenses = df[df['net_amount'] < 0].copy()
+        rows, abs_amount, codes, categories = expenses if expenses is not None else expense_arrays(df)
         
-        if expenses.empty:
+        if len(rows) == 0:
             logger.warning("No expense transactions found")
             return {
                 'anomaly_transactions': [],
@@ -35,79 +184,49 @@ def detect_anomalies(df: pd.DataFrame, z_threshold: float = 3.0) -> dict:
                 'stats_by_category': {}
             }
         
-        # Calculate absolute amounts for analysis
-        expenses['abs_amount'] = expenses['net_amount'].abs()
-        
-        # Group by category and calculate statistics
-        category_stats = expenses.groupby('category')['abs_amount'].agg(['mean', 'std', 'count'])
-        
-        # Calculate Z-scores for each transaction
-        expenses['z_score'] = np.nan
-        
-        for category in expenses['category'].unique():
-            mask = expenses['category'] == category
-            category_data = expenses.loc[mask, 'abs_amount']
-            
-            # Get category statistics
-            cat_mean = category_stats.loc[category, 'mean']
-            cat_std = category_stats.loc[category, 'std']
-            cat_count = category_stats.loc[category, 'count']
-            
-            # Only calculate Z-scores if we have enough data and std > 0
-            if cat_count >= 3 and cat_std > 0:
-                z_scores = (category_data - cat_mean) / cat_std
-                expenses.loc[mask, 'z_score'] = z_scores
-            else:
-                # Not enough data or no variance - mark as non-anomalous
-                expenses.loc[mask, 'z_score'] = 0.0
+        # Calculate statistics and Z-scores for each transaction
+        n_groups = len(categories)
+        z_scores, means, stds, counts = _grouped_zscores(abs_amount, codes, n_groups)
         
         # Flag anomalies based on absolute Z-score
-        expenses['is_anomaly'] = expenses['z_score'].abs() > z_threshold
-        
-        # Extract anomalies
-        anomalies = expenses[expenses['is_anomaly']].copy()
+        anomaly_idx = np.flatnonzero(np.abs(z_scores) > z_threshold)
         
         # Calculate anomaly rate
-        anomaly_rate = len(anomalies) / len(expenses) if len(expenses) > 0 else 0.0
+        anomaly_rate = len(anomaly_idx) / len(rows)
         
-        # Get top anomalies (top 10% or at least top 10)
-        n_top = max(10, int(len(anomalies) * 0.1))
-        largest_anomalies = anomalies.nlargest(n_top, 'abs_amount')
+        # Get top anomalies (top 10% or at least top 10), largest amount first
+        n_top = max(10, int(len(anomaly_idx) * 0.1))
+        largest_idx = anomaly_idx[_top_k_indices(abs_amount[anomaly_idx], n_top)]
+        
+        # Expected range per category (one entry per category, not per row)
+        observed = np.flatnonzero(counts > 0)
+        expected_ranges = np.empty(n_groups, dtype=object)
+        expected_ranges[observed] = [f"${means[g]:.2f} ± ${stds[g]:.2f}" for g in observed]
         
         # Prepare anomaly transactions for output
-        anomaly_records = []
-        for _, row in anomalies.iterrows():
-            anomaly_records.append({
-                'date': row['date'].strftime('%Y-%m-%d') if pd.notna(row['date']) else None,
-                'description': row['desc'],
-                'amount': float(row['abs_amount']),
-                'category': row['category'],
-                'z_score': float(row['z_score']),
-                'expected_range': f"${category_stats.loc[row['category'], 'mean']:.2f} ± ${category_stats.loc[row['category'], 'std']:.2f}"
-            })
+        anomaly_records = _to_records(
+            df, rows[anomaly_idx], abs_amount[anomaly_idx], codes[anomaly_idx], categories,
+            z_scores[anomaly_idx], expected_ranges[codes[anomaly_idx]]
+        )
         
         # Prepare largest anomalies for output
-        largest_records = []
-        for _, row in largest_anomalies.iterrows():
-            largest_records.append({
-                'date': row['date'].strftime('%Y-%m-%d') if pd.notna(row['date']) else None,
-                'description': row['desc'],
-                'amount': float(row['abs_amount']),
-                'category': row['category'],
-                'z_score': float(row['z_score'])
-            })
+        largest_records = _to_records(
+            df, rows[largest_idx], abs_amount[largest_idx], codes[largest_idx], categories,
+            z_scores[largest_idx]
+        )
         
         # Prepare category statistics
+        anomaly_counts = np.bincount(codes[anomaly_idx], minlength=n_groups)
         stats_by_category = {}
-        for category in category_stats.index:
-            stats_by_category[category] = {
-                'mean': float(category_stats.loc[category, 'mean']),
-                'std': float(category_stats.loc[category, 'std']),
-                'count': int(category_stats.loc[category, 'count']),
-                'anomaly_count': int(anomalies[anomalies['category'] == category].shape[0])
+        for g in observed:
+            stats_by_category[categories[g]] = {
+                'mean': float(means[g]),
+                'std': float(stds[g]),
+                'count': int(counts[g]),
+                'anomaly_count': int(anomaly_counts[g])
             }
         
-        logger.info(f"Detected {len(anomalies)} anomalies out of {len(expenses)} expenses")
+        logger.info(f"Detected {len(anomaly_idx)} anomalies out of {len(rows)} expenses")
         logger.info(f"Anomaly rate: {anomaly_rate:.2%}")
         
         return {
@@ -115,8 +234,8 @@ def detect_anomalies(df: pd.DataFrame, z_threshold: float = 3.0) -> dict:
             'anomaly_rate': float(anomaly_rate),
             'largest_anomalies': largest_records,
             'stats_by_category': stats_by_category,
-            'total_anomalies': len(anomalies),
-            'total_expenses': len(expenses)
+            'total_anomalies': len(anomaly_idx),
+            'total_expenses': len(rows)
         }
         
     except Exception as e:
@@ -124,19 +243,22 @@ def detect_anomalies(df: pd.DataFrame, z_threshold: float = 3.0) -> dict:
         raise
 
 
-def get_spending_insights(df: pd.DataFrame) -> dict:
+def get_spending_insights(df: pd.DataFrame, expenses: ExpenseArrays = None) -> dict:
     """
     Generate spending insights from transaction data
     
     Args:
         df: DataFrame with categorized transactions
+        expenses: Precomputed expense arrays for df (optional)
         
     Returns:
         Dictionary containing spending insights
     """
-    expenses = df[df['net_amount'] < 0].copy()
+    if expenses is None:
+        expenses = expense_arrays(df)
+    rows, abs_amount, codes, _ = expenses
     
-    if expenses.empty:
+    if len(rows) == 0:
         return {
             'total_spending': 0.0,
             'avg_transaction': 0.0,
@@ -144,22 +266,25 @@ def get_spending_insights(df: pd.DataFrame) -> dict:
             'spending_trend': []
         }
     
-    expenses['abs_amount'] = expenses['net_amount'].abs()
-    
     # Total spending
-    total_spending = expenses['abs_amount'].sum()
+    total_spending = abs_amount.sum()
     
     # Average transaction
-    avg_transaction = expenses['abs_amount'].mean()
+    avg_transaction = abs_amount.mean()
     
     # Spending by category
-    spending_by_category = expenses.groupby('category')['abs_amount'].sum().to_dict()
+    spending_by_category = category_spending(expenses).to_dict()
     
-    # Monthly spending trend
-    expenses['year_month'] = expenses['date'].dt.to_period('M')
-    monthly_spending = expenses.groupby('year_month')['abs_amount'].sum().reset_index()
-    monthly_spending['year_month'] = monthly_spending['year_month'].astype(str)
-    spending_trend = monthly_spending.to_dict('records')
+    # Monthly spending trend keyed by an integer year * 12 + (month - 1)
+    dates = df['date'].iloc[rows]
+    valid = dates.notna().to_numpy()
+    year_month = (dates.dt.year.to_numpy()[valid] * 12 + dates.dt.month.to_numpy()[valid] - 1).astype(np.int64)
+    month_codes, months = pd.factorize(year_month, sort=True)
+    monthly_spending = np.bincount(month_codes, weights=abs_amount[valid], minlength=len(months))
+    spending_trend = [
+        {'year_month': f"{ym // 12}-{ym % 12 + 1:02d}", 'abs_amount': float(amount)}
+        for ym, amount in zip(months, monthly_spending)
+    ]
     
     return {
         'total_spending': float(total_spending),
@@ -167,4 +292,3 @@ def get_spending_insights(df: pd.DataFrame) -> dict:
         'spending_by_category': {k: float(v) for k, v in spending_by_category.items()},
         'spending_trend': spending_trend
     }
-
@@ -1,12 +1,16 @@
 """
 BERT Categorizer Module
-Categorizes transactions using pretrained transformer models
+Categorizes transactions using pretrained sentence-embedding models
 """
 import pandas as pd
 import numpy as np
-from transformers import pipeline
+import torch
+from scipy.special import softmax
+from sentence_transformers import SentenceTransformer
 import logging
+import threading
 import joblib
+from collections import OrderedDict
 from pathlib import Path
 
 logging.basicConfig(level=logging.INFO)
@@ -19,30 +23,92 @@ CATEGORIES = [
     'Investment', 'Salary_Income', 'Transfer', 'ATM_Withdrawal', 'Other'
 ]
 
+# Natural-language descriptors embedded once per category
+CATEGORY_PROMPTS = {
+    'Food': 'restaurant, cafe or food delivery expense',
+    'Groceries': 'groceries and supermarket shopping',
+    'Transport': 'taxi, fuel, metro or bus transport expense',
+    'Bills_Utilities': 'electricity, water, phone or internet bill payment',
+    'Shopping': 'online or retail shopping purchase',
+    'Entertainment': 'movies, games, music or streaming subscription',
+    'Healthcare': 'hospital, doctor or pharmacy medical expense',
+    'Education': 'school, college, course or tuition fees',
+    'Travel': 'flight, hotel or holiday travel booking',
+    'Insurance': 'insurance premium payment',
+    'Investment': 'mutual fund, stocks or savings investment',
+    'Salary_Income': 'salary credit or income deposit',
+    'Transfer': 'bank transfer or UPI payment to a person',
+    'ATM_Withdrawal': 'ATM cash withdrawal',
+    'Other': 'miscellaneous transaction'
+}
+
+# Temperature applied to cosine similarities before softmax
+SIMILARITY_TEMPERATURE = 0.05
+
+# Cross-request cache of (model_name, quantize, cleaned description) -> (category, confidence)
+CACHE_MAX_SIZE = 10000
+_category_cache = OrderedDict()
+_category_cache_lock = threading.Lock()
+
+
+def _get_cached_category(model_key: tuple, clean_desc: str):
+    """Return the cached (category, confidence) for a description, or None"""
+    key = (*model_key, clean_desc)
+    with _category_cache_lock:
+        if key not in _category_cache:
+            return None
+        _category_cache.move_to_end(key)
+        return _category_cache[key]
+
+
+def _set_cached_category(model_key: tuple, clean_desc: str, category: str, confidence: float):
+    """Store a categorization result, evicting the least recently used entry when full"""
+    key = (*model_key, clean_desc)
+    with _category_cache_lock:
+        _category_cache[key] = (category, confidence)
+        _category_cache.move_to_end(key)
+        if len(_category_cache) > CACHE_MAX_SIZE:
+            _category_cache.popitem(last=False)
+
 
 class BERTCategorizer:
-    """Zero-shot classification for financial transactions"""
+    """Embedding similarity classification for financial transactions"""
     
-    def __init__(self, model_name: str = "facebook/bart-large-mnli"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", quantize: bool = True):
         """
         Initialize the categorizer with a pretrained model
         
         Args:
-            model_name: Name of the pretrained model for zero-shot classification
+            model_name: Name of the pretrained sentence-embedding model
+            quantize: Apply dynamic int8 quantization to the model's linear layers
         """
         self.model_name = model_name
+        self.quantize = quantize
         self.categories = CATEGORIES
-        self.classifier = None
+        self.model = None
+        self.label_emb = None
         self._load_model()
     
     def _load_model(self):
-        """Load the zero-shot classification pipeline"""
+        """Load the sentence-embedding model and embed the category descriptors"""
         try:
             logger.info(f"Loading pretrained model: {self.model_name}")
-            self.classifier = pipeline(
-                "zero-shot-classification",
-                model=self.model_name,
-                device=-1  # Use CPU; set to 0 for GPU
+            self.model = SentenceTransformer(self.model_name, device='cpu')
+            self.model.eval()
+            
+            # int8 weights for the linear layers; activations are quantized on the fly
+            if self.quantize:
+                torch.quantization.quantize_dynamic(
+                    self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                )
+                logger.info("Applied dynamic int8 quantization")
+            
+            # Precompute normalized label embeddings once
+            prompt_list = [CATEGORY_PROMPTS[category] for category in self.categories]
+            self.label_emb = self.model.encode(
+                prompt_list,
+                convert_to_numpy=True,
+                normalize_embeddings=True
             )
             logger.info("Model loaded successfully")
         except Exception as e:
@@ -70,55 +136,72 @@ class BERTCategorizer:
         
         return desc
     
-    def categorize_batch(self, descriptions: list, batch_size: int = 8) -> tuple:
+    def categorize_batch(self, descriptions: list, batch_size: int = 64) -> tuple:
         """
         Categorize a batch of transaction descriptions
         
         Args:
             descriptions: List of transaction descriptions
-            batch_size: Number of descriptions to process at once
+            batch_size: Number of descriptions to encode at once
             
         Returns:
             Tuple of (categories, confidence_scores)
         """
-        categories = []
-        confidences = []
+        categories, confidences, _ = self._classify(descriptions, batch_size)
+        return categories, confidences
+    
+    def _classify(self, descriptions: list, batch_size: int = 64) -> tuple:
+        """
+        Categorize descriptions, reporting which results came from the model
         
+        Args:
+            descriptions: List of transaction descriptions
+            batch_size: Number of descriptions to encode at once
+            
+        Returns:
+            Tuple of (categories, confidence_scores, resolved) where resolved[i]
+            is False when description i fell back to 'Other' after a model error
+        """
         logger.info(f"Categorizing {len(descriptions)} transactions")
         
-        for i in range(0, len(descriptions), batch_size):
-            batch = descriptions[i:i + batch_size]
-            
-            for desc in batch:
-                # Preprocess
-                clean_desc = self._preprocess_description(desc)
-                
-                if not clean_desc:
-                    categories.append('Other')
-                    confidences.append(0.5)
-                    continue
+        # Preprocess
+        cleaned = [self._preprocess_description(desc) for desc in descriptions]
+        
+        # Empty descriptions default to 'Other' without hitting the model
+        categories = ['Other'] * len(cleaned)
+        confidences = [0.5] * len(cleaned)
+        resolved = [True] * len(cleaned)
+        to_classify = [i for i, clean_desc in enumerate(cleaned) if clean_desc]
+        
+        if not to_classify:
+            return categories, confidences, resolved
+        
+        # Encode batch by batch so a failure only falls back for that batch
+        for start in range(0, len(to_classify), batch_size):
+            batch = to_classify[start:start + batch_size]
+            try:
+                # Cosine similarity against every category descriptor
+                emb = self.model.encode(
+                    [cleaned[i] for i in batch],
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+                scores = emb @ self.label_emb.T
+                probs = softmax(scores / SIMILARITY_TEMPERATURE, axis=1)
                 
-                try:
-                    # Perform zero-shot classification
-                    result = self.classifier(
-                        clean_desc,
-                        candidate_labels=self.categories,
-                        multi_label=False
-                    )
+                # Get top prediction
+                best = scores.argmax(axis=1)
+                for i, label_idx, prob in zip(batch, best, probs.max(axis=1)):
+                    categories[i] = self.categories[label_idx]
+                    confidences[i] = float(prob)
                     
-                    # Get top prediction
-                    categories.append(result['labels'][0])
-                    confidences.append(result['scores'][0])
-                    
-                except Exception as e:
-                    logger.warning(f"Error categorizing '{desc}': {str(e)}")
-                    categories.append('Other')
-                    confidences.append(0.5)
-            
-            if (i + batch_size) % 50 == 0:
-                logger.info(f"Processed {min(i + batch_size, len(descriptions))}/{len(descriptions)} transactions")
+            except Exception as e:
+                logger.warning(f"Error categorizing batch of {len(batch)} transactions: {str(e)}")
+                for i in batch:
+                    resolved[i] = False
         
-        return categories, confidences
+        return categories, confidences, resolved
     
     def save(self, path: str):
         """
@@ -129,7 +212,8 @@ class BERTCategorizer:
         """
         config = {
             'model_name': self.model_name,
-            'categories': self.categories
+            'categories': self.categories,
+            'quantize': self.quantize
         }
         joblib.dump(config, path)
         logger.info(f"Saved categorizer config to {path}")
@@ -146,40 +230,69 @@ class BERTCategorizer:
             BERTCategorizer instance
         """
         config = joblib.load(path)
-        return cls(model_name=config['model_name'])
+        return cls(model_name=config['model_name'], quantize=config.get('quantize', True))
 
 
 def categorize_transactions(
     df: pd.DataFrame, 
     model_path: str = None,
-    batch_size: int = 8
+    batch_size: int = 64,
+    categorizer: BERTCategorizer = None
 ) -> tuple:
     """
     Categorize transactions in a DataFrame
     
+    The 'category' and 'confidence' columns are added to df in place.
+    
     Args:
         df: DataFrame with 'desc' column
         model_path: Path to saved model (optional)
         batch_size: Batch size for processing
+        categorizer: Already loaded categorizer to reuse (optional)
         
     Returns:
         Tuple of (categorized_df, metrics_dict)
     """
-    # Load or create categorizer
-    if model_path and Path(model_path).exists():
-        logger.info(f"Loading categorizer from {model_path}")
-        categorizer = BERTCategorizer.load(model_path)
-    else:
-        categorizer = BERTCategorizer()
+    # Load or create categorizer unless one was provided
+    if categorizer is None:
+        if model_path and Path(model_path).exists():
+            logger.info(f"Loading categorizer from {model_path}")
+            categorizer = BERTCategorizer.load(model_path)
+        else:
+            categorizer = BERTCategorizer()
+    
+    # Get descriptions, deduplicated so repeated merchants are classified once
+    cleaned = [categorizer._preprocess_description(desc) for desc in df['desc'].tolist()]
+    unique_descs, inverse = np.unique(np.array(cleaned, dtype=str), return_inverse=True)
+    unique_descs = unique_descs.tolist()
+    
+    # Reuse results cached by earlier requests with the same model and precision
+    model_key = (categorizer.model_name, categorizer.quantize)
+    results = {}
+    for desc in unique_descs:
+        cached = _get_cached_category(model_key, desc)
+        if cached is not None:
+            results[desc] = cached
+    misses = [desc for desc in unique_descs if desc not in results]
+    
+    # Categorize only the unseen descriptions
+    if misses:
+        miss_categories, miss_confidences, resolved = categorizer._classify(misses, batch_size)
+        for desc, category, confidence, ok in zip(misses, miss_categories, miss_confidences, resolved):
+            results[desc] = (category, confidence)
+            # Fallbacks from a failed model call are not cached, so a later request retries them
+            if ok:
+                _set_cached_category(model_key, desc, category, confidence)
     
-    # Get descriptions
-    descriptions = df['desc'].tolist()
+    logger.info(f"Categorized {len(unique_descs)} unique descriptions ({len(misses)} uncached) for {len(cleaned)} transactions")
     
-    # Categorize
-    categories, confidences = categorizer.categorize_batch(descriptions, batch_size)
+    # Broadcast back to every transaction
+    unique_categories = np.array([results[desc][0] for desc in unique_descs], dtype=object)
+    unique_confidences = np.array([results[desc][1] for desc in unique_descs], dtype=float)
+    categories = unique_categories[inverse]
+    confidences = unique_confidences[inverse]
     
     # Add to DataFrame
-    df = df.copy()
     df['category'] = categories
     df['confidence'] = confidences
     
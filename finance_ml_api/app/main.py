@@ -7,30 +7,82 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
 from pathlib import Path
-import tempfile
-import shutil
+import aiofiles
+import aiofiles.tempfile
 import base64
 import io
+import os
+import asyncio
+import functools
 import logging
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 
-from app.pdf_extractor import extract_transactions
-from app.bert_categorizer import categorize_transactions, CATEGORIES
-from app.anomaly_detector import detect_anomalies, get_spending_insights
+from app.pdf_extractor import ExtractionPool, extract_transactions
+from app.bert_categorizer import BERTCategorizer, categorize_transactions, CATEGORIES
+from app.anomaly_detector import (
+    ExpenseArrays, category_spending, detect_anomalies, expense_arrays, get_spending_insights
+)
 from app.xgboost_forecaster import forecast_spending
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Worker threads for the CPU-bound pipeline steps so the event loop stays free
+PIPELINE_WORKERS = min(4, os.cpu_count() or 1)
+
+# One worker per chart so the three plots render side by side
+CHART_WORKERS = 3
+
+
+async def run_in_executor(executor: ThreadPoolExecutor, func, *args, **kwargs):
+    """Run a blocking function on the given thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the worker pools and load the categorization model once per app startup"""
+    app.state.extraction_pool = ExtractionPool()
+    app.state.pipeline_executor = ThreadPoolExecutor(
+        max_workers=PIPELINE_WORKERS,
+        thread_name_prefix="pipeline"
+    )
+    app.state.chart_executor = ThreadPoolExecutor(
+        max_workers=CHART_WORKERS,
+        thread_name_prefix="chart"
+    )
+    try:
+        # Prefer the local copy saved by init_models.py
+        if EMBEDDING_MODEL_DIR.exists():
+            logger.info(f"Loading categorization model from {EMBEDDING_MODEL_DIR}")
+            app.state.categorizer = await run_in_executor(
+                app.state.pipeline_executor, BERTCategorizer, model_name=str(EMBEDDING_MODEL_DIR)
+            )
+        else:
+            logger.info("Loading categorization model")
+            app.state.categorizer = await run_in_executor(app.state.pipeline_executor, BERTCategorizer)
+        yield
+    finally:
+        app.state.pipeline_executor.shutdown(wait=False)
+        app.state.chart_executor.shutdown(wait=False)
+        app.state.extraction_pool.shutdown()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Personal Finance ML API",
     description="AI-powered bank statement analysis with categorization, anomaly detection, and forecasting",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -45,6 +97,7 @@ app.add_middleware(
 # Model directory
 MODEL_DIR = Path(__file__).parent.parent / "models"
 MODEL_DIR.mkdir(exist_ok=True)
+EMBEDDING_MODEL_DIR = MODEL_DIR / "all-MiniLM-L6-v2"
 
 # Static directory
 STATIC_DIR = Path(__file__).parent.parent / "static"
@@ -53,50 +106,80 @@ IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
+# Upload limits
+MAX_FILE_SIZE_MB = 50
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
+def _save_figure(fig: Figure, filename: str, base_url: str) -> str:
+    """
+    Rasterize a figure to the images directory
+    
+    Args:
+        fig: Matplotlib figure to save
+        filename: Name of the PNG file
+        base_url: Base URL for constructing image links
+        
+    Returns:
+        URL to the saved PNG image
+    """
+    filepath = IMAGES_DIR / filename
+    fig.savefig(str(filepath), dpi=100, bbox_inches='tight')
+    return f"{base_url}static/images/{filename}"
 
-def create_category_pie_chart(df: pd.DataFrame, base_url: str) -> str:
+
+def create_category_pie_chart(df: pd.DataFrame, base_url: str, expenses: ExpenseArrays = None) -> str:
     """
     Create a pie chart showing spending by category
     
     Args:
         df: DataFrame with categorized transactions
         base_url: Base URL for constructing image links
+        expenses: Precomputed expense arrays for df (optional)
         
     Returns:
         URL to the saved PNG image
     """
     # Filter expenses
-    expenses = df[df['net_amount'] < 0].copy()
-    expenses['abs_amount'] = expenses['net_amount'].abs()
+    if expenses is None:
+        expenses = expense_arrays(df)
     
     # Aggregate by category
-    category_spending = expenses.groupby('category')['abs_amount'].sum().sort_values(ascending=False)
+    spending = category_spending(expenses).sort_values(ascending=False)
     
-    # Create pie chart
-    fig = go.Figure(data=[go.Pie(
-        labels=category_spending.index,
-        values=category_spending.values,
-        hole=0.3,
-        textinfo='label+percent',
-        textposition='auto'
-    )])
+    fig = Figure(figsize=(8, 6))
+    ax = fig.add_subplot()
     
-    fig.update_layout(
-        title="Spending Distribution by Category",
-        showlegend=True,
-        width=800,
-        height=600
+    if spending.empty:
+        # Create empty plot
+        ax.text(0.5, 0.5, "No spending data available",
+                ha='center', va='center', fontsize=20, transform=ax.transAxes)
+        ax.set_axis_off()
+        ax.set_title("Spending Distribution by Category")
+        # Save to file
+        filename = f"pie_empty_{uuid.uuid4()}.png"
+        return _save_figure(fig, filename, base_url)
+    
+    # Create donut chart
+    wedges, _, _ = ax.pie(
+        spending.values,
+        labels=spending.index,
+        autopct='%1.1f%%',
+        startangle=90,
+        counterclock=False,
+        wedgeprops=dict(width=0.7)
     )
+    ax.set_title("Spending Distribution by Category")
+    ax.legend(wedges, spending.index, loc='center left', bbox_to_anchor=(1, 0.5))
+    ax.axis('equal')
     
     # Save to file
     filename = f"pie_{uuid.uuid4()}.png"
-    filepath = IMAGES_DIR / filename
-    fig.write_image(str(filepath))
-    
-    return f"{base_url}static/images/{filename}"
+    return _save_figure(fig, filename, base_url)
 
 
-def create_anomaly_scatter(df: pd.DataFrame, anomalies_info: dict, base_url: str) -> str:
+def create_anomaly_scatter(df: pd.DataFrame, anomalies_info: dict, base_url: str,
+                           expenses: ExpenseArrays = None) -> str:
     """
     Create a scatter plot showing anomalous transactions
     
@@ -104,60 +187,42 @@ def create_anomaly_scatter(df: pd.DataFrame, anomalies_info: dict, base_url: str
         df: DataFrame with categorized transactions
         anomalies_info: Anomaly detection results
         base_url: Base URL for constructing image links
+        expenses: Precomputed expense arrays for df (optional)
         
     Returns:
         URL to the saved PNG image
     """
     # Filter expenses
-    expenses = df[df['net_amount'] < 0].copy()
-    expenses['abs_amount'] = expenses['net_amount'].abs()
+    if expenses is None:
+        expenses = expense_arrays(df)
+    dates = df['date'].iloc[expenses.rows]
+    amounts = expenses.abs_amount
     
     # Mark anomalies
     anomaly_dates = [a['date'] for a in anomalies_info['anomaly_transactions']]
-    expenses['is_anomaly'] = expenses['date'].dt.strftime('%Y-%m-%d').isin(anomaly_dates)
+    is_anomaly = dates.dt.strftime('%Y-%m-%d').isin(anomaly_dates).to_numpy()
+    dates = dates.to_numpy()
     
     # Create scatter plot
-    fig = go.Figure()
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
     
     # Normal transactions
-    normal = expenses[~expenses['is_anomaly']]
-    fig.add_trace(go.Scatter(
-        x=normal['date'],
-        y=normal['abs_amount'],
-        mode='markers',
-        name='Normal',
-        marker=dict(color='blue', size=6, opacity=0.6)
-    ))
+    ax.scatter(dates[~is_anomaly], amounts[~is_anomaly], c='blue', s=36, alpha=0.6, label='Normal')
     
     # Anomalous transactions
-    anomalous = expenses[expenses['is_anomaly']]
-    if not anomalous.empty:
-        fig.add_trace(go.Scatter(
-            x=anomalous['date'],
-            y=anomalous['abs_amount'],
-            mode='markers',
-            name='Anomaly',
-            marker=dict(color='red', size=10, symbol='diamond'),
-            text=anomalous['desc'],
-            hovertemplate='<b>%{text}</b><br>Amount: $%{y:.2f}<br>Date: %{x}<extra></extra>'
-        ))
+    if is_anomaly.any():
+        ax.scatter(dates[is_anomaly], amounts[is_anomaly], c='red', s=100, marker='D', label='Anomaly')
     
-    fig.update_layout(
-        title="Transaction Anomalies Over Time",
-        xaxis_title="Date",
-        yaxis_title="Amount ($)",
-        showlegend=True,
-        width=1000,
-        height=600,
-        hovermode='closest'
-    )
+    ax.set_title("Transaction Anomalies Over Time")
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Amount ($)")
+    ax.legend()
+    fig.autofmt_xdate()
     
     # Save to file
     filename = f"anomaly_{uuid.uuid4()}.png"
-    filepath = IMAGES_DIR / filename
-    fig.write_image(str(filepath))
-    
-    return f"{base_url}static/images/{filename}"
+    return _save_figure(fig, filename, base_url)
 
 
 def create_forecast_bar(forecast_info: dict, df: pd.DataFrame, base_url: str) -> str:
@@ -175,60 +240,61 @@ def create_forecast_bar(forecast_info: dict, df: pd.DataFrame, base_url: str) ->
     # Extract forecasts
     forecasts = forecast_info['forecasts']
     
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot()
+    
     if not forecasts:
         # Create empty plot
-        fig = go.Figure()
-        fig.add_annotation(
-            text="Insufficient data for forecasting",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5, showarrow=False,
-            font=dict(size=20)
-        )
-        fig.update_layout(
-            title="Spending Forecast (Next 3 Months)",
-            width=1000,
-            height=600
-        )
+        ax.text(0.5, 0.5, "Insufficient data for forecasting",
+                ha='center', va='center', fontsize=20, transform=ax.transAxes)
+        ax.set_axis_off()
+        ax.set_title("Spending Forecast (Next 3 Months)")
         # Save to file
         filename = f"forecast_empty_{uuid.uuid4()}.png"
-        filepath = IMAGES_DIR / filename
-        fig.write_image(str(filepath))
-        return f"{base_url}static/images/{filename}"
+        return _save_figure(fig, filename, base_url)
     
     # Prepare data
     categories = list(forecasts.keys())
     months = ['Month 1', 'Month 2', 'Month 3']
     
     # Create grouped bar chart
-    fig = go.Figure()
+    x = np.arange(len(categories))
+    width = 0.8 / len(months)
     
     for i, month in enumerate(months):
         values = [forecasts[cat]['predictions'][i] for cat in categories]
-        fig.add_trace(go.Bar(
-            name=month,
-            x=categories,
-            y=values,
-            text=[f'${v:.0f}' for v in values],
-            textposition='auto'
-        ))
+        bars = ax.bar(x + (i - (len(months) - 1) / 2) * width, values, width, label=month)
+        ax.bar_label(bars, labels=[f'${v:.0f}' for v in values], fontsize=8)
     
-    fig.update_layout(
-        title="Spending Forecast by Category (Next 3 Months)",
-        xaxis_title="Category",
-        yaxis_title="Forecasted Amount ($)",
-        barmode='group',
-        showlegend=True,
-        width=1000,
-        height=600,
-        xaxis_tickangle=-45
-    )
+    ax.set_title("Spending Forecast by Category (Next 3 Months)")
+    ax.set_xlabel("Category")
+    ax.set_ylabel("Forecasted Amount ($)")
+    ax.set_xticks(x)
+    ax.set_xticklabels(categories, rotation=45, ha='right')
+    ax.legend()
     
     # Save to file
     filename = f"forecast_{uuid.uuid4()}.png"
-    filepath = IMAGES_DIR / filename
-    fig.write_image(str(filepath))
+    return _save_figure(fig, filename, base_url)
+
+
+def _safe_chart(name: str, chart_func, *args) -> str:
+    """
+    Build a chart, returning an empty URL instead of failing the request
     
-    return f"{base_url}static/images/{filename}"
+    Args:
+        name: Chart name used in error logs
+        chart_func: Chart builder returning an image URL
+        *args: Arguments for the chart builder
+        
+    Returns:
+        URL to the saved PNG image, or "" on error
+    """
+    try:
+        return chart_func(*args)
+    except Exception as e:
+        logger.error(f"Error creating {name}: {str(e)}")
+        return ""
 
 
 @app.get("/")
@@ -265,41 +331,61 @@ async def process_pdf(request: Request, pdf_file: UploadFile = File(...)):
     
     try:
         base_url = str(request.base_url)
+        pipeline = request.app.state.pipeline_executor
+        charts = request.app.state.chart_executor
         logger.info(f"Processing uploaded file: {pdf_file.filename}")
         
         # Validate file type
         if not pdf_file.filename.endswith('.pdf'):
             raise HTTPException(status_code=400, detail="Only PDF files are supported")
         
-        # Save uploaded file to temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            shutil.copyfileobj(pdf_file.file, temp_file)
+        # Stream uploaded file to temporary location without blocking the event loop
+        async with aiofiles.tempfile.NamedTemporaryFile('wb', delete=False, suffix='.pdf') as temp_file:
             temp_pdf_path = temp_file.name
+            total_bytes = 0
+            while chunk := await pdf_file.read(UPLOAD_CHUNK_SIZE):
+                total_bytes += len(chunk)
+                if total_bytes > MAX_FILE_SIZE_MB * 1024 * 1024:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File exceeds the {MAX_FILE_SIZE_MB} MB upload limit"
+                    )
+                await temp_file.write(chunk)
         
         logger.info("File saved to temporary location")
         
         # Step 1: Extract transactions
         logger.info("Step 1: Extracting transactions from PDF")
-        transactions_df = extract_transactions(temp_pdf_path)
+        transactions_df = await run_in_executor(
+            pipeline, extract_transactions, temp_pdf_path, pool=request.app.state.extraction_pool
+        )
         
         if transactions_df.empty:
             raise HTTPException(status_code=400, detail="No transactions found in PDF")
         
         # Step 2: Categorize transactions
         logger.info("Step 2: Categorizing transactions")
-        categorized_df, categorization_metrics = categorize_transactions(
+        categorized_df, categorization_metrics = await run_in_executor(
+            pipeline,
+            categorize_transactions,
             transactions_df,
-            batch_size=8
+            batch_size=64,
+            categorizer=request.app.state.categorizer
         )
         
+        # Expense rows shared by anomaly detection, charts and the summary
+        expenses = expense_arrays(categorized_df)
+        
         # Step 3: Detect anomalies
         logger.info("Step 3: Detecting anomalies")
-        anomalies_info = detect_anomalies(categorized_df)
+        anomalies_info = await run_in_executor(pipeline, detect_anomalies, categorized_df, expenses=expenses)
         
         # Step 4: Generate forecasts
         logger.info("Step 4: Generating spending forecasts")
         try:
-            forecast_info = forecast_spending(
+            forecast_info = await run_in_executor(
+                pipeline,
+                forecast_spending,
                 categorized_df,
                 n_months=3,
                 model_dir=str(MODEL_DIR)
@@ -317,36 +403,26 @@ async def process_pdf(request: Request, pdf_file: UploadFile = File(...)):
         # Step 5: Generate visualizations
         logger.info("Step 5: Generating visualizations")
         
-        try:
-            category_pie = create_category_pie_chart(categorized_df, base_url)
-        except Exception as e:
-            logger.error(f"Error creating category pie chart: {str(e)}")
-            category_pie = ""
-        
-        try:
-            anomaly_scatter = create_anomaly_scatter(categorized_df, anomalies_info, base_url)
-        except Exception as e:
-            logger.error(f"Error creating anomaly scatter: {str(e)}")
-            anomaly_scatter = ""
-        
-        try:
-            forecast_bar = create_forecast_bar(forecast_info, categorized_df, base_url)
-        except Exception as e:
-            logger.error(f"Error creating forecast bar: {str(e)}")
-            forecast_bar = ""
+        category_pie, anomaly_scatter, forecast_bar = await asyncio.gather(
+            run_in_executor(charts, _safe_chart, "category pie chart",
+                            create_category_pie_chart, categorized_df, base_url, expenses),
+            run_in_executor(charts, _safe_chart, "anomaly scatter",
+                            create_anomaly_scatter, categorized_df, anomalies_info, base_url, expenses),
+            run_in_executor(charts, _safe_chart, "forecast bar",
+                            create_forecast_bar, forecast_info, categorized_df, base_url)
+        )
         
         # Step 6: Prepare summary statistics
         total_transactions = len(transactions_df)
-        expenses = categorized_df[categorized_df['net_amount'] < 0]
-        total_spend = float(expenses['net_amount'].abs().sum())
+        total_spend = float(expenses.abs_amount.sum())
         
         date_range = f"{transactions_df['date'].min().year}-{transactions_df['date'].max().year}"
         
         # Prepare top categories with spending amounts
         top_categories = {}
-        category_totals = expenses.groupby('category')['net_amount'].apply(lambda x: float(x.abs().sum()))
+        category_totals = category_spending(expenses)
         for cat, amount in category_totals.nlargest(5).items():
-            top_categories[cat] = amount
+            top_categories[cat] = float(amount)
         
         # Prepare forecast summary
         next_month_forecasts = {}
@@ -2,22 +2,224 @@
 PDF Extractor Module
 Extracts transaction data from bank statement PDFs
 """
+import gc
+import multiprocessing
+import os
+import re
+import threading
 import camelot
+import pypdfium2 as pdfium
 import pandas as pd
 import numpy as np
-from typing import Optional
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Thousands separators, whitespace and currency symbols stripped from amounts
+CURRENCY_NOISE = re.compile(r'[,\s₹]')
 
-def extract_transactions(pdf_path: str) -> pd.DataFrame:
+# Statement date formats, tried in order on a sample of the date column
+DATE_FORMATS = ['%d-%m-%Y', '%d/%m/%Y']
+
+# Pages handed to Camelot per call; bounds the rendered page images held at once
+PAGE_CHUNK_SIZE = 50
+
+# Worker processes for extraction; each gets its own Ghostscript instance
+EXTRACT_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# Page ranges are only split across workers when each gets at least this many pages
+MIN_PAGES_PER_WORKER = 10
+
+
+class ExtractionPool:
+    """
+    Long-lived worker processes for Camelot extraction
+    
+    Page counting and every page range run in these processes, so PDFium and
+    Ghostscript (neither thread-safe) never run inside the API process. A pool
+    broken by a crashed worker is replaced on the next submit.
+    """
+    
+    def __init__(self, max_workers: int = EXTRACT_MAX_WORKERS):
+        """
+        Initialize the pool
+        
+        Args:
+            max_workers: Number of worker processes
+        """
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = self._create_executor()
+    
+    def _create_executor(self) -> ProcessPoolExecutor:
+        """Start a process pool; spawned since forking a process holding torch and threads is unsafe"""
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    
+    def submit(self, func, *args) -> Future:
+        """
+        Schedule func(*args) on a worker process
+        
+        Args:
+            func: Picklable module-level function
+            *args: Arguments for func
+            
+        Returns:
+            Future for the result
+        """
+        with self._lock:
+            try:
+                return self._executor.submit(func, *args)
+            except BrokenProcessPool:
+                logger.warning("Extraction worker pool is broken, starting a new one")
+                self._executor.shutdown(wait=False)
+                self._executor = self._create_executor()
+                return self._executor.submit(func, *args)
+    
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_count(pdf_path: str) -> int:
+    """
+    Count the pages in a PDF without rendering them
+    
+    Args:
+        pdf_path: Path to the PDF file
+        
+    Returns:
+        Number of pages
+    """
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _page_ranges(n_pages: int, chunk_size: int = PAGE_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Split 1-based pages into Camelot page-range strings
+    
+    Args:
+        n_pages: Total number of pages
+        chunk_size: Pages per range
+        
+    Returns:
+        Iterator of ranges like '1-50', '51-100'
+    """
+    for lo in range(1, n_pages + 1, chunk_size):
+        hi = min(lo + chunk_size - 1, n_pages)
+        yield f"{lo}-{hi}"
+
+
+def _extract_chunk(pdf_path: str, pages: str) -> List[pd.DataFrame]:
+    """
+    Extract the table DataFrames from one page range
+    
+    Only each table's DataFrame is returned; the Camelot tables (and their
+    page images) are released before returning.
+    
+    Args:
+        pdf_path: Path to the PDF file
+        pages: Camelot page-range string, e.g. '1-20'
+        
+    Returns:
+        List of table DataFrames in page order
+    """
+    tables = camelot.read_pdf(
+        pdf_path, 
+        pages=pages, 
+        flavor='lattice'
+    )
+    frames = [table.df for table in tables]
+    del tables
+    gc.collect()
+    return frames
+
+
+def _read_table_frames(pdf_path: str, pool: Optional[ExtractionPool] = None,
+                       chunk_size: int = PAGE_CHUNK_SIZE) -> List[pd.DataFrame]:
+    """
+    Extract table DataFrames from all pages, page ranges in parallel processes
+    
+    Args:
+        pdf_path: Path to the PDF file
+        pool: Worker processes to extract in; without one, pages are read
+            in the calling process (only safe for single-threaded callers)
+        chunk_size: Maximum pages per Camelot call
+        
+    Returns:
+        List of table DataFrames in page order
+    """
+    if pool is None:
+        n_pages = _page_count(pdf_path)
+        return [
+            frame
+            for pages in _page_ranges(n_pages, chunk_size)
+            for frame in _extract_chunk(pdf_path, pages)
+        ]
+    
+    # PDFium is not thread-safe either, so count pages in a worker too
+    n_pages = pool.submit(_page_count, pdf_path).result()
+    
+    # Split across workers only when each range is worth a round trip;
+    # short statements go to a single worker as one range
+    chunk_size = min(chunk_size, max(MIN_PAGES_PER_WORKER, -(-n_pages // pool.max_workers)))
+    ranges = list(_page_ranges(n_pages, chunk_size))
+    
+    chunks = [None] * len(ranges)
+    futures = {
+        pool.submit(_extract_chunk, pdf_path, pages): i
+        for i, pages in enumerate(ranges)
+    }
+    for future in as_completed(futures):
+        i = futures[future]
+        try:
+            chunks[i] = future.result()
+        except Exception as e:
+            # A crashed worker (e.g. Ghostscript) fails its range; retry it once in the pool
+            logger.warning(f"Extraction of pages {ranges[i]} failed in worker ({str(e)}), retrying")
+            chunks[i] = pool.submit(_extract_chunk, pdf_path, ranges[i]).result()
+    
+    return [frame for chunk in chunks for frame in chunk]
+
+
+def _detect_date_format(values: pd.Series, sample_size: int = 50) -> Optional[str]:
+    """
+    Detect the date format from a sample of non-empty values
+    
+    Args:
+        values: Raw date column
+        sample_size: Number of non-empty values to test
+        
+    Returns:
+        The first matching format from DATE_FORMATS, or None to infer
+    """
+    values = values.dropna().astype(str)
+    sample = values[values.str.strip() != ''].head(sample_size)
+    for fmt in DATE_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors='coerce').notna().any():
+            return fmt
+    return None
+
+
+def extract_transactions(pdf_path: str, pool: Optional[ExtractionPool] = None) -> pd.DataFrame:
     """
     Extract transactions from a bank statement PDF
     
     Args:
         pdf_path: Path to the PDF file
+        pool: Worker processes for Camelot (optional; required when called
+            from multiple threads)
         
     Returns:
         DataFrame with extracted and cleaned transaction data
@@ -28,19 +230,16 @@ def extract_transactions(pdf_path: str) -> pd.DataFrame:
     try:
         # Extract tables from PDF using lattice method
         logger.info(f"Extracting tables from {pdf_path}")
-        tables = camelot.read_pdf(
-            pdf_path, 
-            pages='all', 
-            flavor='lattice'
-        )
+        frames = _read_table_frames(pdf_path, pool)
         
-        if len(tables) == 0:
+        if len(frames) == 0:
             raise ValueError("No tables detected in PDF. Please ensure it's a valid bank statement.")
         
-        logger.info(f"Found {len(tables)} tables in PDF")
+        logger.info(f"Found {len(frames)} tables in PDF")
         
         # Concatenate all tables
-        dfs = pd.concat([table.df for table in tables], ignore_index=True)
+        dfs = pd.concat(frames, ignore_index=True)
+        del frames
         
         if dfs.empty:
             raise ValueError("Extracted tables are empty")
@@ -49,35 +248,35 @@ def extract_transactions(pdf_path: str) -> pd.DataFrame:
         if dfs.shape[1] < 5:
             raise ValueError(f"Expected at least 5 columns, found {dfs.shape[1]}")
         
-        # Parse transaction date (column 0)
-        dfs['transaction_date'] = pd.to_datetime(
-            dfs[0], 
-            format='%d-%m-%Y', 
-            errors='coerce'
-        )
-        
-        # Also try alternative date formats if parsing fails
-        if dfs['transaction_date'].isna().all():
+        # Parse transaction date (column 0) in a single pass with the detected format
+        date_format = _detect_date_format(dfs[0])
+        if date_format:
             dfs['transaction_date'] = pd.to_datetime(
                 dfs[0], 
-                format='%d/%m/%Y', 
-                errors='coerce'
+                format=date_format, 
+                errors='coerce',
+                cache=True
             )
-        if dfs['transaction_date'].isna().all():
+        else:
             dfs['transaction_date'] = pd.to_datetime(
                 dfs[0], 
-                errors='coerce'
+                errors='coerce',
+                cache=True
             )
         
-        # Forward fill and backward fill ALL columns
-        dfs = dfs.ffill().bfill()
+        # Carry dates and descriptions onto rows that continue the one above;
+        # amounts are never filled, so a missing amount stays missing (0 below)
+        fill_columns = ['transaction_date', 1]
+        dfs[fill_columns] = dfs[fill_columns].ffill().bfill()
         
         # Convert numeric columns (credited_amount, debited_amount, balance)
         for col in [2, 3, 4]:
             if col < dfs.shape[1]:
-                # Remove currency symbols and commas
-                dfs[col] = dfs[col].astype(str).str.replace(',', '').str.replace('₹', '').str.strip()
-                dfs[col] = pd.to_numeric(dfs[col], errors='coerce')
+                values = dfs[col]
+                if values.dtype != object:
+                    values = values.astype(str)
+                # Remove currency symbols, commas and whitespace in a single pass
+                dfs[col] = pd.to_numeric(values.str.replace(CURRENCY_NOISE, '', regex=True), errors='coerce')
         
         # Fill NaN in numeric columns with 0
         dfs[[2, 3, 4]] = dfs[[2, 3, 4]].fillna(0)
@@ -89,32 +288,31 @@ def extract_transactions(pdf_path: str) -> pd.DataFrame:
         dfs = dfs[
             (dfs['net_amount'].abs() > 0) & 
             (dfs['transaction_date'].notna())
-        ].copy()
+        ]
         
         if dfs.empty:
             raise ValueError("No valid transactions found after filtering")
         
-        # Add time-based features
-        dfs['month'] = dfs['transaction_date'].dt.month
-        dfs['year'] = dfs['transaction_date'].dt.year
-        dfs['day_of_week'] = dfs['transaction_date'].dt.dayofweek
-        
-        # Rename columns for clarity
-        dfs = dfs[[
-            'transaction_date', 1, 2, 3, 4, 
-            'net_amount', 'month', 'year', 'day_of_week'
-        ]]
-        dfs.columns = [
-            'date', 'desc', 'credit', 'debit', 'balance', 
-            'net_amount', 'month', 'year', 'day_of_week'
-        ]
+        # Build the output with clear column names and time-based features in one go
+        dates = dfs['transaction_date']
+        transactions = pd.DataFrame({
+            'date': dates.to_numpy(),
+            'desc': dfs[1].to_numpy(),
+            'credit': dfs[2].to_numpy(),
+            'debit': dfs[3].to_numpy(),
+            'balance': dfs[4].to_numpy(),
+            'net_amount': dfs['net_amount'].to_numpy(),
+            'month': dates.dt.month.to_numpy(dtype=np.int8),
+            'year': dates.dt.year.to_numpy(dtype=np.int16),
+            'day_of_week': dates.dt.dayofweek.to_numpy(dtype=np.int8)
+        })
         
-        # Sort by date and reset index
-        dfs = dfs.sort_values('date').reset_index(drop=True)
+        # Sort by date with a fresh index
+        transactions.sort_values('date', ignore_index=True, inplace=True)
         
-        logger.info(f"Successfully extracted {len(dfs)} transactions")
+        logger.info(f"Successfully extracted {len(transactions)} transactions")
         
-        return dfs
+        return transactions
         
     except Exception as e:
         logger.error(f"Error extracting transactions: {str(e)}")
@@ -125,11 +323,21 @@ def save_transactions(df: pd.DataFrame, output_path: str) -> None:
     """
     Save transactions DataFrame to parquet format
     
+    Repeated descriptions (and categories, when present) are stored
+    dictionary-encoded, and the file is zstd-compressed.
+    
     Args:
         df: Transaction DataFrame
         output_path: Path to save the parquet file
     """
-    df.to_parquet(output_path, index=False)
+    text_columns = [col for col in ('desc', 'category') if col in df.columns]
+    df.astype({col: 'category' for col in text_columns}).to_parquet(
+        output_path,
+        engine='pyarrow',
+        compression='zstd',
+        compression_level=3,
+        index=False
+    )
     logger.info(f"Saved transactions to {output_path}")
 
 
@@ -137,6 +345,9 @@ def load_transactions(input_path: str) -> pd.DataFrame:
     """
     Load transactions from parquet file
     
+    Dictionary-encoded columns written by save_transactions come back as
+    pandas categoricals.
+    
     Args:
         input_path: Path to the parquet file
         
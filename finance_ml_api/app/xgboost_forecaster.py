@@ -5,15 +5,201 @@ Forecasts future spending using XGBoost regression models
 import pandas as pd
 import numpy as np
 import xgboost as xgb
+from numba import njit
 from sklearn.model_selection import TimeSeriesSplit
 from sklearn.metrics import mean_absolute_error
 import joblib
+from joblib import Parallel, delayed
+import json
 import logging
+import os
+import threading
 from pathlib import Path
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Seasonal encoding for months 1..12, indexed by (month - 1)
+_MONTH_SIN = np.sin(2 * np.pi * np.arange(1, 13) / 12)
+_MONTH_COS = np.cos(2 * np.pi * np.arange(1, 13) / 12)
+
+# Booster parameters; one thread per model since categories train concurrently
+XGB_PARAMS = {
+    'objective': 'reg:squarederror',
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'seed': 42,
+    'tree_method': 'hist',
+    'nthread': 1
+}
+XGB_NUM_ROUNDS = 200
+
+# Serializes save/load so concurrent requests never interleave model and sidecar files
+_MODEL_DIR_LOCK = threading.Lock()
+
+# Model inputs, in the column order produced by _build_features
+FEATURE_COLUMNS = [
+    'lag_1', 'lag_2', 'lag_3', 
+    'rolling_3m', 'rolling_std_3m',
+    'month_sin', 'month_cos',
+    'total_trend', 'month_index'
+]
+
+# Narrow dtypes for the monthly feature frame; XGBoost bins float32 anyway
+FEATURE_DTYPES = {
+    'amount': np.float32,
+    'lag_1': np.float32,
+    'lag_2': np.float32,
+    'lag_3': np.float32,
+    'rolling_3m': np.float32,
+    'rolling_std_3m': np.float32,
+    'month_sin': np.float32,
+    'month_cos': np.float32,
+    'total_trend': np.float32,
+    'month': np.int8,
+    'year': np.int16,
+    'month_index': np.int16
+}
+
+
+@njit(cache=True)
+def _rolling_mean_std3(a):
+    """
+    Trailing 3-period mean and sample std with min_periods=1, in one pass
+    
+    Matches pandas rolling(window=3, min_periods=1).mean()/.std():
+    the std of a single-value window is NaN.
+    
+    Args:
+        a: Contiguous float64 array
+        
+    Returns:
+        Tuple of (rolling_mean, rolling_std)
+    """
+    n = a.shape[0]
+    mean = np.empty(n)
+    std = np.empty(n)
+    for i in range(n):
+        start = max(0, i - 2)
+        k = i - start + 1
+        total = 0.0
+        for j in range(start, i + 1):
+            total += a[j]
+        m = total / k
+        mean[i] = m
+        if k < 2:
+            std[i] = np.nan
+        else:
+            sq = 0.0
+            for j in range(start, i + 1):
+                sq += (a[j] - m) * (a[j] - m)
+            std[i] = np.sqrt(sq / (k - 1))
+    return mean, std
+
+
+@njit(cache=True)
+def _build_features(amount, month):
+    """
+    Build every monthly feature in one compiled pass
+    
+    Leading lags, the first rolling std and the first trend value are 0;
+    a 0/0 trend repeats the previous value, as a forward fill would.
+    
+    Args:
+        amount: Monthly totals as a contiguous float64 array
+        month: Calendar month (1-12) of each row
+        
+    Returns:
+        float32 array of shape (n, len(FEATURE_COLUMNS)) in FEATURE_COLUMNS order
+    """
+    n = amount.shape[0]
+    features = np.zeros((n, 9), dtype=np.float32)
+    rolling_mean, rolling_std = _rolling_mean_std3(amount)
+    prev_trend = 0.0
+    for i in range(n):
+        # Lags
+        if i >= 1:
+            features[i, 0] = amount[i - 1]
+        if i >= 2:
+            features[i, 1] = amount[i - 2]
+        if i >= 3:
+            features[i, 2] = amount[i - 3]
+        
+        # Rolling statistics
+        features[i, 3] = rolling_mean[i]
+        if i >= 1:
+            features[i, 4] = rolling_std[i]
+        
+        # Seasonal features
+        features[i, 5] = _MONTH_SIN[month[i] - 1]
+        features[i, 6] = _MONTH_COS[month[i] - 1]
+        
+        # Trend features
+        if i >= 1:
+            if amount[i - 1] != 0:
+                prev_trend = amount[i] / amount[i - 1] - 1
+            elif amount[i] != 0:
+                prev_trend = np.inf * np.sign(amount[i])
+            features[i, 7] = prev_trend
+        features[i, 8] = i
+    return features
+
+
+# Compile (or load from the on-disk cache) at import, not in the first request
+_build_features(np.zeros(1), np.ones(1, dtype=np.int64))
+
+
+def _train_one(category: str, cat_df: pd.DataFrame, feature_columns: list) -> tuple:
+    """
+    Cross-validate and fit the model for a single category
+    
+    Args:
+        category: Category name
+        cat_df: Monthly feature DataFrame for the category
+        feature_columns: Columns used as model inputs
+        
+    Returns:
+        Tuple of (category, model_data, metrics)
+    """
+    logger.info(f"Training model for category: {category}")
+    
+    # Prepare features and target
+    X = cat_df[feature_columns].to_numpy(dtype=np.float32)
+    y = cat_df['amount'].to_numpy(dtype=np.float32)
+    
+    # Time series split
+    tscv = TimeSeriesSplit(n_splits=min(5, len(X) - 1))
+    
+    # Cross-validation on quantized histogram matrices
+    mae_scores = []
+    for train_idx, test_idx in tscv.split(X):
+        dtrain = xgb.QuantileDMatrix(X[train_idx], y[train_idx])
+        fold_model = xgb.train(XGB_PARAMS, dtrain, num_boost_round=XGB_NUM_ROUNDS)
+        y_pred = fold_model.inplace_predict(X[test_idx])
+        mae = mean_absolute_error(y[test_idx], y_pred)
+        mae_scores.append(mae)
+    
+    avg_mae = np.mean(mae_scores)
+    
+    # Train final model on all data
+    model = xgb.train(XGB_PARAMS, xgb.QuantileDMatrix(X, y), num_boost_round=XGB_NUM_ROUNDS)
+    
+    model_data = {
+        'model': model,
+        'last_data': {k: cat_df[k].iat[-1].item() for k in feature_columns + ['month']},
+        'mae': avg_mae
+    }
+    
+    metrics = {
+        'mae': float(avg_mae),
+        'cv_maes': [float(m) for m in mae_scores],
+        'data_points': len(cat_df)
+    }
+    
+    logger.info(f"Category '{category}' - MAE: {avg_mae:.2f}")
+    
+    return category, model_data, metrics
+
 
 class SpendingForecaster:
     """XGBoost-based forecasting for spending predictions"""
@@ -40,29 +226,17 @@ class SpendingForecaster:
         Returns:
             DataFrame with engineered features
         """
-        df = monthly_df.copy()
-        
-        # Lag features
-        df['lag_1'] = df['amount'].shift(1)
-        df['lag_2'] = df['amount'].shift(2)
-        df['lag_3'] = df['amount'].shift(3)
-        
-        # Rolling statistics
-        df['rolling_3m'] = df['amount'].rolling(window=3, min_periods=1).mean()
-        df['rolling_std_3m'] = df['amount'].rolling(window=3, min_periods=1).std()
-        
-        # Seasonal features
-        df['month_sin'] = np.sin(2 * np.pi * df['month'] / 12)
-        df['month_cos'] = np.cos(2 * np.pi * df['month'] / 12)
+        df = monthly_df.reset_index(drop=True)
         
-        # Trend features
-        df['total_trend'] = df['amount'].pct_change()
-        df['month_index'] = range(len(df))
-        
-        # Fill NaN values
-        df = df.ffill().fillna(0)
+        # Lags, rolling statistics, seasonal and trend features in one kernel;
+        # fresh writable arrays match the signature compiled at import
+        features = _build_features(
+            np.array(df['amount'], dtype=np.float64),
+            np.array(df['month'], dtype=np.int64)
+        )
+        df = pd.concat([df, pd.DataFrame(features, columns=FEATURE_COLUMNS)], axis=1)
         
-        return df
+        return df.astype(FEATURE_DTYPES)
     
     def _prepare_data(self, df: pd.DataFrame) -> dict:
         """
@@ -78,40 +252,41 @@ class SpendingForecaster:
         expenses = df[df['net_amount'] < 0].copy()
         expenses['abs_amount'] = expenses['net_amount'].abs()
         
+        # Categorical keys so both groupbys below use codes instead of hashing strings
+        expenses['category'] = expenses['category'].astype('category')
+        
         # Create year-month column
         expenses['year_month'] = expenses['date'].dt.to_period('M')
         
         # Aggregate by category and month
         monthly_by_category = expenses.groupby(
-            ['year_month', 'category']
+            ['year_month', 'category'], observed=True
         )['abs_amount'].sum().reset_index()
         
         # Calculate total spending to identify major categories (>5%)
         total_spending = expenses['abs_amount'].sum()
-        category_spending = expenses.groupby('category')['abs_amount'].sum()
+        category_spending = expenses.groupby('category', observed=True)['abs_amount'].sum()
         major_categories = category_spending[category_spending / total_spending > 0.05].index.tolist()
         
         self.major_categories = major_categories
         logger.info(f"Major categories (>5% spending): {major_categories}")
         
+        # Restrict to major categories once, sorted so each group is already in month order
+        mbc = monthly_by_category[monthly_by_category['category'].isin(major_categories)]
+        mbc = mbc.sort_values(['category', 'year_month']).rename(columns={'abs_amount': 'amount'})
+        mbc['month'] = mbc['year_month'].dt.month
+        mbc['year'] = mbc['year_month'].dt.year
+        
         # Prepare data for each major category
         category_data = {}
         
-        for category in major_categories:
-            cat_data = monthly_by_category[monthly_by_category['category'] == category].copy()
-            
+        for category, cat_data in mbc.groupby('category', observed=True, sort=False):
             if len(cat_data) < self.min_history_months:
                 logger.warning(f"Category '{category}' has insufficient history ({len(cat_data)} months)")
                 continue
             
-            # Extract features
-            cat_data['month'] = cat_data['year_month'].dt.month
-            cat_data['year'] = cat_data['year_month'].dt.year
-            cat_data = cat_data.rename(columns={'abs_amount': 'amount'})
-            cat_data = cat_data.sort_values('year_month').reset_index(drop=True)
-            
             # Create features
-            cat_data = self._create_monthly_features(cat_data)
+            cat_data = self._create_monthly_features(cat_data.reset_index(drop=True))
             
             category_data[category] = cat_data
         
@@ -134,64 +309,21 @@ class SpendingForecaster:
             raise ValueError("Insufficient data for forecasting. Need at least 6 months of history.")
         
         # Feature columns
-        self.feature_columns = [
-            'lag_1', 'lag_2', 'lag_3', 
-            'rolling_3m', 'rolling_std_3m',
-            'month_sin', 'month_cos',
-            'total_trend', 'month_index'
-        ]
+        self.feature_columns = list(FEATURE_COLUMNS)
         
-        metrics = {}
+        # Categories are independent, so train them concurrently. XGBoost
+        # releases the GIL while fitting, so threads avoid pickling frames
+        # and models across processes.
+        n_jobs = min(len(category_data), os.cpu_count() or 1)
+        results = Parallel(n_jobs=n_jobs, prefer='threads')(
+            delayed(_train_one)(category, cat_df, self.feature_columns)
+            for category, cat_df in category_data.items()
+        )
         
-        for category, cat_df in category_data.items():
-            logger.info(f"Training model for category: {category}")
-            
-            # Prepare features and target
-            X = cat_df[self.feature_columns]
-            y = cat_df['amount']
-            
-            # Time series split
-            tscv = TimeSeriesSplit(n_splits=min(5, len(X) - 1))
-            
-            # Train model
-            model = xgb.XGBRegressor(
-                n_estimators=200,
-                max_depth=6,
-                learning_rate=0.1,
-                random_state=42,
-                objective='reg:squarederror'
-            )
-            
-            # Cross-validation
-            mae_scores = []
-            for train_idx, test_idx in tscv.split(X):
-                X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
-                y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
-                
-                model.fit(X_train, y_train, verbose=False)
-                y_pred = model.predict(X_test)
-                mae = mean_absolute_error(y_test, y_pred)
-                mae_scores.append(mae)
-            
-            avg_mae = np.mean(mae_scores)
-            
-            # Train final model on all data
-            model.fit(X, y, verbose=False)
-            
-            # Store model
-            self.models[category] = {
-                'model': model,
-                'last_data': cat_df.iloc[-1].to_dict(),
-                'mae': avg_mae
-            }
-            
-            metrics[category] = {
-                'mae': float(avg_mae),
-                'cv_maes': [float(m) for m in mae_scores],
-                'data_points': len(cat_df)
-            }
-            
-            logger.info(f"Category '{category}' - MAE: {avg_mae:.2f}")
+        metrics = {}
+        for category, model_data, category_metrics in results:
+            self.models[category] = model_data
+            metrics[category] = category_metrics
         
         return metrics
     
@@ -210,39 +342,37 @@ class SpendingForecaster:
         
         forecasts = {}
         
+        # Column positions of the features updated between steps
+        feat_idx = {name: i for i, name in enumerate(self.feature_columns)}
+        lag_1, lag_2, lag_3 = feat_idx['lag_1'], feat_idx['lag_2'], feat_idx['lag_3']
+        
         for category, model_data in self.models.items():
-            model = model_data['model']
+            booster = model_data['model']
             last_data = model_data['last_data']
             
             predictions = []
-            current_features = {k: last_data[k] for k in self.feature_columns}
+            
+            # Single preallocated feature row, updated in place each step
+            row = np.empty((1, len(self.feature_columns)), dtype=np.float32)
+            row[0] = [last_data[k] for k in self.feature_columns]
             
             # Recursive forecasting
             for i in range(n_months):
-                # Prepare feature vector
-                X_pred = pd.DataFrame([current_features])
-                
                 # Predict
-                pred = model.predict(X_pred)[0]
+                pred = float(booster.inplace_predict(row)[0])
                 predictions.append(max(0, pred))  # Ensure non-negative
                 
                 # Update features for next prediction
-                current_features['lag_3'] = current_features['lag_2']
-                current_features['lag_2'] = current_features['lag_1']
-                current_features['lag_1'] = pred
-                current_features['rolling_3m'] = np.mean([
-                    current_features['lag_1'],
-                    current_features['lag_2'],
-                    current_features['lag_3']
-                ])
-                current_features['month_index'] += 1
+                row[0, lag_3] = row[0, lag_2]
+                row[0, lag_2] = row[0, lag_1]
+                row[0, lag_1] = pred
+                row[0, feat_idx['rolling_3m']] = row[0, [lag_1, lag_2, lag_3]].mean(dtype=np.float64)
+                row[0, feat_idx['month_index']] += 1
                 
-                # Update seasonal features
-                next_month = (last_data['month'] + i + 1) % 12
-                if next_month == 0:
-                    next_month = 12
-                current_features['month_sin'] = np.sin(2 * np.pi * next_month / 12)
-                current_features['month_cos'] = np.cos(2 * np.pi * next_month / 12)
+                # Update seasonal features (month after last_data['month'] + i)
+                next_month_idx = int(last_data['month'] + i) % 12
+                row[0, feat_idx['month_sin']] = _MONTH_SIN[next_month_idx]
+                row[0, feat_idx['month_cos']] = _MONTH_COS[next_month_idx]
             
             forecasts[category] = {
                 'predictions': [float(p) for p in predictions],
@@ -263,22 +393,27 @@ class SpendingForecaster:
         model_path = Path(model_dir)
         model_path.mkdir(parents=True, exist_ok=True)
         
-        for category, model_data in self.models.items():
-            # Clean category name for filename
-            clean_category = category.replace('_', '').replace(' ', '')
-            filepath = model_path / f"xgb_{clean_category}.pkl"
-            joblib.dump(model_data, filepath)
-            logger.info(f"Saved model for '{category}' to {filepath}")
-        
-        # Save forecaster config
-        config = {
-            'feature_columns': self.feature_columns,
-            'major_categories': self.major_categories,
-            'min_history_months': self.min_history_months
-        }
-        config_path = model_path / "forecaster_config.pkl"
-        joblib.dump(config, config_path)
-        logger.info(f"Saved forecaster config to {config_path}")
+        with _MODEL_DIR_LOCK:
+            for category, model_data in self.models.items():
+                # Clean category name for filename
+                clean_category = category.replace('_', '').replace(' ', '')
+                filepath = model_path / f"xgb_{clean_category}.ubj"
+                
+                # Native booster format, plus a JSON sidecar for the forecast state
+                model_data['model'].save_model(str(filepath))
+                with open(filepath.with_suffix('.json'), 'w') as f:
+                    json.dump({'last_data': model_data['last_data'], 'mae': float(model_data['mae'])}, f)
+                logger.info(f"Saved model for '{category}' to {filepath}")
+            
+            # Save forecaster config
+            config = {
+                'feature_columns': self.feature_columns,
+                'major_categories': self.major_categories,
+                'min_history_months': self.min_history_months
+            }
+            config_path = model_path / "forecaster_config.pkl"
+            joblib.dump(config, config_path)
+            logger.info(f"Saved forecaster config to {config_path}")
     
     @classmethod
     def load(cls, model_dir: str):
@@ -298,21 +433,29 @@ class SpendingForecaster:
         if not config_path.exists():
             raise FileNotFoundError(f"Config not found at {config_path}")
         
-        config = joblib.load(config_path)
-        
-        # Create forecaster instance
-        forecaster = cls(min_history_months=config['min_history_months'])
-        forecaster.feature_columns = config['feature_columns']
-        forecaster.major_categories = config['major_categories']
-        
-        # Load models
-        for category in forecaster.major_categories:
-            clean_category = category.replace('_', '').replace(' ', '')
-            filepath = model_path / f"xgb_{clean_category}.pkl"
+        with _MODEL_DIR_LOCK:
+            config = joblib.load(config_path)
             
-            if filepath.exists():
-                forecaster.models[category] = joblib.load(filepath)
-                logger.info(f"Loaded model for '{category}'")
+            # Create forecaster instance
+            forecaster = cls(min_history_months=config['min_history_months'])
+            forecaster.feature_columns = config['feature_columns']
+            forecaster.major_categories = config['major_categories']
+            
+            # Load models
+            for category in forecaster.major_categories:
+                clean_category = category.replace('_', '').replace(' ', '')
+                filepath = model_path / f"xgb_{clean_category}.ubj"
+                
+                if filepath.exists():
+                    booster = xgb.Booster()
+                    booster.load_model(str(filepath))
+                    with open(filepath.with_suffix('.json')) as f:
+                        model_data = json.load(f)
+                    model_data['model'] = booster
+                    forecaster.models[category] = model_data
+                    logger.info(f"Loaded model for '{category}'")
+                else:
+                    logger.warning(f"No saved model for major category '{category}' at {filepath}")
         
         return forecaster
 
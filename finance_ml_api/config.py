@@ -9,9 +9,9 @@ API_HOST = "0.0.0.0"
 API_PORT = 8000
 
 # Model Configuration
-BERT_MODEL_NAME = "facebook/bart-large-mnli"
+BERT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
 USE_GPU = False  # Set to True if CUDA is available
-BATCH_SIZE = 8
+BATCH_SIZE = 64
 
 # Forecasting Configuration
 MIN_HISTORY_MONTHS = 6
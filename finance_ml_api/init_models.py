@@ -4,7 +4,7 @@ Pre-downloads and verifies ML models
 """
 import logging
 from pathlib import Path
-from transformers import pipeline
+from sentence_transformers import SentenceTransformer
 import sys
 
 logging.basicConfig(level=logging.INFO)
@@ -13,33 +13,40 @@ logger = logging.getLogger(__name__)
 MODEL_DIR = Path(__file__).parent / "models"
 MODEL_DIR.mkdir(exist_ok=True)
 
+# Local copy of the embedding model, loaded by the API instead of the hub
+EMBEDDING_MODEL_DIR = MODEL_DIR / "all-MiniLM-L6-v2"
+
 
 def initialize_bert_model():
-    """Download and initialize BERT model for categorization"""
+    """Download and initialize the sentence-embedding model for categorization"""
     try:
-        logger.info("Initializing BERT model for zero-shot classification...")
-        model_name = "facebook/bart-large-mnli"
+        logger.info("Initializing sentence-embedding model for categorization...")
+        model_name = "sentence-transformers/all-MiniLM-L6-v2"
         
-        classifier = pipeline(
-            "zero-shot-classification",
-            model=model_name,
-            device=-1  # CPU
-        )
+        model = SentenceTransformer(model_name, device='cpu')
         
-        # Test with a sample transaction
-        test_result = classifier(
-            "Payment to Walmart Supercenter",
-            candidate_labels=["Food", "Groceries", "Shopping"],
-            multi_label=False
+        # Test with a sample transaction against a few category descriptors
+        labels = ["Food", "Groceries", "Shopping"]
+        label_emb = model.encode(
+            ["restaurant, cafe or food delivery expense",
+             "groceries and supermarket shopping",
+             "online or retail shopping purchase"],
+            normalize_embeddings=True
         )
+        test_emb = model.encode(["Payment to Walmart Supercenter"], normalize_embeddings=True)
+        scores = (test_emb @ label_emb.T)[0]
         
-        logger.info(f"Model test successful! Predicted: {test_result['labels'][0]}")
-        logger.info(f"Confidence: {test_result['scores'][0]:.3f}")
+        logger.info(f"Model test successful! Predicted: {labels[scores.argmax()]}")
+        logger.info(f"Similarity: {scores.max():.3f}")
+        
+        # Save a local copy so API startup needs no hub lookup or download
+        model.save(str(EMBEDDING_MODEL_DIR))
+        logger.info(f"Saved model to {EMBEDDING_MODEL_DIR}")
         
         return True
         
     except Exception as e:
-        logger.error(f"Error initializing BERT model: {str(e)}")
+        logger.error(f"Error initializing categorization model: {str(e)}")
         return False
 
 
@@ -55,19 +62,13 @@ def verify_dependencies():
         import numpy
         import sklearn
         import xgboost
-        import plotly
+        import matplotlib
         import transformers
+        import sentence_transformers
         import torch
         
         logger.info("✓ All core dependencies verified")
         
-        # Check optional dependencies
-        try:
-            import kaleido
-            logger.info("✓ Kaleido (for plot export) verified")
-        except ImportError:
-            logger.warning("⚠ Kaleido not found - plot export may not work")
-        
         return True
         
     except ImportError as e:
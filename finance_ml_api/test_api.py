@@ -3,10 +3,17 @@ Test Script for Personal Finance ML API
 Run this script to test the API with a sample PDF
 """
 import requests
+from requests.adapters import HTTPAdapter
 import json
+import shutil
 import sys
 from pathlib import Path
 
+# One keep-alive session for the health check, upload and plot downloads
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 
 def test_api(pdf_path: str, api_url: str = "http://localhost:8000"):
     """
@@ -23,7 +30,7 @@ def test_api(pdf_path: str, api_url: str = "http://localhost:8000"):
     
     # Check if API is running
     try:
-        response = requests.get(f"{api_url}/health", timeout=5)
+        response = SESSION.get(f"{api_url}/health", timeout=5)
         if response.status_code != 200:
             print(f"Error: API health check failed")
             sys.exit(1)
@@ -40,7 +47,7 @@ def test_api(pdf_path: str, api_url: str = "http://localhost:8000"):
         files = {'pdf_file': f}
         
         try:
-            response = requests.post(
+            response = SESSION.post(
                 f"{api_url}/process-pdf",
                 files=files,
                 timeout=120  # 2 minutes timeout
@@ -113,11 +120,11 @@ def test_api(pdf_path: str, api_url: str = "http://localhost:8000"):
                 
                 # Save plots
                 if result['plots']['category_pie']:
-                    save_base64_image(result['plots']['category_pie'], "category_pie.png")
+                    download_image(result['plots']['category_pie'], "category_pie.png")
                 if result['plots']['anomaly_scatter']:
-                    save_base64_image(result['plots']['anomaly_scatter'], "anomaly_scatter.png")
+                    download_image(result['plots']['anomaly_scatter'], "anomaly_scatter.png")
                 if result['plots']['forecast_bar']:
-                    save_base64_image(result['plots']['forecast_bar'], "forecast_bar.png")
+                    download_image(result['plots']['forecast_bar'], "forecast_bar.png")
                 
                 print("\n" + "=" * 60)
                 
@@ -131,16 +138,13 @@ def test_api(pdf_path: str, api_url: str = "http://localhost:8000"):
             print(f"Error: {str(e)}")
 
 
-def save_base64_image(base64_string: str, filename: str):
-    """Save a base64 encoded image to file"""
-    import base64
-    
-    # Remove the data:image/png;base64, prefix
-    image_data = base64_string.split(',')[1] if ',' in base64_string else base64_string
-    
-    # Decode and save
-    with open(filename, 'wb') as f:
-        f.write(base64.b64decode(image_data))
+def download_image(image_url: str, filename: str):
+    """Download a plot image served by the API, streaming it straight to file"""
+    with SESSION.get(image_url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        with open(filename, 'wb') as f:
+            shutil.copyfileobj(response.raw, f)
     
     print(f"✓ Saved plot: {filename}")
 